@@ -1,26 +1,76 @@
+import json
 import logging
+import msgspec
 import requests
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Union
+
+from tracing import Tracer
 
 logger = logging.getLogger(__name__)
 
+DECODER_GENERIC = "generic"
+DECODER_TYPED = "typed"
+
+# Schema of the stations.json response. Only the fields read by extract_measurement_data
+# are declared, all other fields are skipped by the decoder without being materialized.
+# The records cannot form reference cycles, so they are not tracked by the garbage collector.
+
+
+class CurrentMeasurement(msgspec.Struct, gc=False):
+    timestamp: Optional[str] = None
+    value: Optional[float] = None
+    stateMnwMhw: Optional[str] = None
+    stateNswHsw: Optional[str] = None
+
+
+class Timeseries(msgspec.Struct, gc=False):
+    unit: str
+    currentMeasurement: Optional[CurrentMeasurement] = None
+
+
+class Water(msgspec.Struct, gc=False):
+    shortname: str
+    longname: str
+
+
+class Station(msgspec.Struct, gc=False):
+    shortname: str
+    longname: str
+    km: Optional[float] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    water: Optional[Water] = None
+    timeseries: List[Timeseries] = []
+
+
+_stations_decoder = msgspec.json.Decoder(List[Station])
+
+
 class ApiClient:
     """
     Client for the Pegel Online API.
     Handles fetching data from the API and parsing the response.
     """
     
-    def __init__(self, base_url: str = "https://www.pegelonline.wsv.de/webservices/rest-api/v2"):
+    def __init__(self, base_url: str = "https://www.pegelonline.wsv.de/webservices/rest-api/v2",
+                 tracer: Optional[Tracer] = None, decoder: str = DECODER_TYPED):
         """
         Initialize the API client.
         
         Args:
             base_url: Base URL for the Pegel Online API
+            tracer: Tracer for recording the request stages
+            decoder: "typed" to decode the response into typed records, "generic" for plain dicts
         """
         self.base_url = base_url
+        self.tracer = tracer or Tracer()
+        if decoder not in (DECODER_GENERIC, DECODER_TYPED):
+            raise ValueError(f"Unknown decoder: {decoder}")
+        self.decoder = decoder
         logger.debug(f"Initialized ApiClient with base URL: {base_url}")
     
-    def get_stations(self, include_timeseries: bool = True, include_current_measurement: bool = True) -> List[Dict[str, Any]]:
+    def get_stations(self, include_timeseries: bool = True,
+                     include_current_measurement: bool = True) -> List[Union[Dict[str, Any], Station]]:
         """
         Get all stations from the Pegel Online API.
         
@@ -29,10 +79,11 @@ class ApiClient:
             include_current_measurement: Whether to include current measurement data
             
         Returns:
-            List of station data
+            List of station data, as Station records with the typed decoder
             
         Raises:
             requests.RequestException: If the request fails
+            ValueError: If the response is not valid JSON
         """
         url = f"{self.base_url}/stations.json"
         params = {
@@ -43,22 +94,53 @@ class ApiClient:
         logger.debug(f"Fetching stations from {url} with params {params}")
         
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            stations = response.json()
-            logger.debug(f"Fetched {len(stations)} stations")
+            # Connection setup (DNS, TCP, TLS) and waiting for the response headers
+            with self.tracer.span("http.request"):
+                response = requests.get(url, params=params, stream=True)
+
+            # Closing the streamed response returns its connection to the pool, also on errors
+            with response:
+                response.raise_for_status()
+
+                with self.tracer.span("http.body") as span:
+                    body = response.content
+                    span["bytes"] = len(body)
+
+            with self.tracer.span("json.decode") as span:
+                stations = self.decode_stations(body)
+                span["decoder"] = self.decoder
+
+            logger.debug("Fetched %d stations", len(stations))
             return stations
-        except requests.RequestException as e:
+        except (requests.RequestException, ValueError) as e:
             logger.error(f"Error fetching stations: {e}")
             raise
+
+    def decode_stations(self, body: bytes) -> List[Union[Dict[str, Any], Station]]:
+        """
+        Decode the body of a stations response with the configured decoder.
+        If the response does not match the schema, the generic decoder is used instead.
+        
+        Args:
+            body: Response body
+            
+        Returns:
+            List of station data, as Station records with the typed decoder
+        """
+        if self.decoder == DECODER_TYPED:
+            try:
+                return _stations_decoder.decode(body)
+            except msgspec.ValidationError as e:
+                logger.warning(f"Response does not match the station schema, using generic decoder: {e}")
+        return json.loads(body)
     
     @staticmethod
-    def extract_measurement_data(stations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def extract_measurement_data(stations: List[Union[Dict[str, Any], Station]]) -> List[Dict[str, Any]]:
         """
         Extract measurement data from stations.
         
         Args:
-            stations: List of station data from the API
+            stations: List of station data from the API, as dicts or Station records
             
         Returns:
             List of measurement data with the following structure:
@@ -69,22 +151,31 @@ class ApiClient:
                 "station_longname": str,
                 "latitude": float,
                 "longitude": float,
+                "km": float,
                 "measurement_value": float,
+                "timestamp": str,
                 "state_mnw_mhw": str,
                 "state_nsw_hsw": str
             }
         """
+        if stations and isinstance(stations[0], Station):
+            return ApiClient._extract_from_records(stations)
+
         measurements = []
+        # Checked once, so the skip messages below cost nothing when DEBUG is disabled
+        debug = logger.isEnabledFor(logging.DEBUG)
         
         for station in stations:
             # Skip stations without water information
             if "water" not in station:
-                logger.debug(f"Station {station.get('shortname', 'unknown')} has no water information, skipping")
+                if debug:
+                    logger.debug("Station %s has no water information, skipping", station.get('shortname', 'unknown'))
                 continue
                 
             # Skip stations without timeseries
             if "timeseries" not in station or not station["timeseries"]:
-                logger.debug(f"Station {station.get('shortname', 'unknown')} has no timeseries, skipping")
+                if debug:
+                    logger.debug("Station %s has no timeseries, skipping", station.get('shortname', 'unknown'))
                 continue
             
             water_shortname = station["water"]["shortname"]
@@ -93,21 +184,25 @@ class ApiClient:
             station_longname = station["longname"]
             latitude = station.get("latitude")
             longitude = station.get("longitude")
+            km = station.get("km")
             
             for timeseries in station["timeseries"]:
 
                 if timeseries["unit"] != "cm":
-                    logger.debug("Skipping time series that is not in cm")
+                    if debug:
+                        logger.debug("Skipping time series that is not in cm")
                     continue
 
                 # Skip timeseries without current measurement
                 if "currentMeasurement" not in timeseries:
-                    logger.debug(f"Timeseries in station {station_shortname} has no current measurement, skipping")
+                    if debug:
+                        logger.debug("Timeseries in station %s has no current measurement, skipping", station_shortname)
                     continue
                 
                 current_measurement = timeseries["currentMeasurement"]
 
                 measurement_value = current_measurement.get("value")
+                timestamp = current_measurement.get("timestamp")
                 state_mnw_mhw = current_measurement.get("stateMnwMhw")
                 state_nsw_hsw = current_measurement.get("stateNswHsw")
                 
@@ -118,10 +213,71 @@ class ApiClient:
                     "station_longname": station_longname,
                     "latitude": latitude,
                     "longitude": longitude,
+                    "km": km,
                     "measurement_value": measurement_value,
+                    "timestamp": timestamp,
                     "state_mnw_mhw": state_mnw_mhw,
                     "state_nsw_hsw": state_nsw_hsw
                 })
         
-        logger.debug(f"Extracted {len(measurements)} measurements")
-        return measurements
\ No newline at end of file
+        logger.debug("Extracted %d measurements", len(measurements))
+        return measurements
+
+    @staticmethod
+    def _extract_from_records(stations: List[Station]) -> List[Dict[str, Any]]:
+        """
+        Extract measurement data from stations decoded by the typed decoder.
+        
+        Args:
+            stations: List of Station records
+            
+        Returns:
+            List of measurement data, see extract_measurement_data
+        """
+        measurements = []
+        # Checked once, so the skip messages below cost nothing when DEBUG is disabled
+        debug = logger.isEnabledFor(logging.DEBUG)
+
+        for station in stations:
+            # Skip stations without water information
+            if station.water is None:
+                if debug:
+                    logger.debug("Station %s has no water information, skipping", station.shortname)
+                continue
+
+            # Skip stations without timeseries
+            if not station.timeseries:
+                if debug:
+                    logger.debug("Station %s has no timeseries, skipping", station.shortname)
+                continue
+
+            for timeseries in station.timeseries:
+
+                if timeseries.unit != "cm":
+                    if debug:
+                        logger.debug("Skipping time series that is not in cm")
+                    continue
+
+                # Skip timeseries without current measurement
+                current_measurement = timeseries.currentMeasurement
+                if current_measurement is None:
+                    if debug:
+                        logger.debug("Timeseries in station %s has no current measurement, skipping", station.shortname)
+                    continue
+
+                measurements.append({
+                    "water_shortname": station.water.shortname,
+                    "water_longname": station.water.longname,
+                    "station_shortname": station.shortname,
+                    "station_longname": station.longname,
+                    "latitude": station.latitude,
+                    "longitude": station.longitude,
+                    "km": station.km,
+                    "measurement_value": current_measurement.value,
+                    "timestamp": current_measurement.timestamp,
+                    "state_mnw_mhw": current_measurement.stateMnwMhw,
+                    "state_nsw_hsw": current_measurement.stateNswHsw
+                })
+
+        logger.debug("Extracted %d measurements", len(measurements))
+        return measurements
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the generic and the typed decoder for the stations response.
+
+Usage:
+    python benchmark_decoding.py [stations.json]
+
+Without a file, the current response is fetched from the Pegel Online API.
+"""
+import sys
+import time
+import tracemalloc
+from typing import Callable, Tuple
+
+import requests
+
+from api_client import ApiClient, DECODER_GENERIC, DECODER_TYPED
+
+ROUNDS = 50
+
+
+def fetch_payload() -> bytes:
+    """
+    Fetch the stations response as it is requested by the adapter.
+
+    Returns:
+        Response body
+    """
+    api_client = ApiClient()
+    response = requests.get(f"{api_client.base_url}/stations.json",
+                            params={"includeTimeseries": "true", "includeCurrentMeasurement": "true"})
+    response.raise_for_status()
+    return response.content
+
+
+def measure(func: Callable[[], object]) -> Tuple[float, float, float]:
+    """
+    Measure time and allocations of a function.
+
+    Args:
+        func: Function to measure
+
+    Returns:
+        Tuple of (mean time in ms, peak allocated KiB, KiB still allocated by the result)
+    """
+    func()
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func()
+    mean_ms = (time.perf_counter() - start) / ROUNDS * 1000
+
+    tracemalloc.start()
+    result = func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return mean_ms, peak / 1024, current / 1024
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            body = f.read()
+    else:
+        body = fetch_payload()
+
+    print(f"Payload: {len(body) / 1024:.0f} KiB, {ROUNDS} rounds")
+    print(f"{'decoder':<10} {'stage':<16} {'time ms':>9} {'peak KiB':>10} {'retained KiB':>13}")
+
+    for decoder in (DECODER_GENERIC, DECODER_TYPED):
+        api_client = ApiClient(decoder=decoder)
+        stages = {
+            "decode": lambda: api_client.decode_stations(body),
+            "decode+extract": lambda: api_client.extract_measurement_data(api_client.decode_stations(body))
+        }
+        for stage, func in stages.items():
+            mean_ms, peak, retained = measure(func)
+            print(f"{decoder:<10} {stage:<16} {mean_ms:>9.2f} {peak:>10.0f} {retained:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
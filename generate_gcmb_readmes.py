@@ -9,14 +9,18 @@ import os
 import logging
 import sys
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 
 from api_client import ApiClient
+from spatial_index import StationIndex
+from river_profile import downstream_position, parse_descending_km_waters
 
 # Environment variables
 GCMB_ORG = os.environ.get('GCMB_ORG', 'rivers')
 GCMB_PROJECT = os.environ.get('GCMB_PROJECT', 'pegel-online')
 LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+NEARBY_GAUGES = int(os.environ.get('NEARBY_GAUGES', '5'))
+RIVER_KM_DESCENDING = parse_descending_km_waters(os.environ.get('RIVER_KM_DESCENDING', ''))
 
 # Configure logging
 print(f"Using log level: {LOG_LEVEL}")
@@ -104,6 +108,7 @@ def generate_river_readmes(measurements: List[Dict[str, Any]]):
         station_shortname = measurement["station_shortname"]
         rivers[water_shortname]["stations"][station_shortname] = {
             "longname": measurement["station_longname"],
+            "km": measurement["km"],
             "measurement_value": measurement["measurement_value"]
         }
     
@@ -115,10 +120,14 @@ def generate_river_readmes(measurements: List[Dict[str, Any]]):
         river_dir = GCMB_DIR / sanitize_topic(water_shortname)
         ensure_directory(river_dir)
         
-        # Sort stations by longname
+        # Sort stations upstream to downstream, stations without km last by longname
         sorted_stations = sorted(
             river_data["stations"].items(),
-            key=lambda x: x[1]["longname"]
+            key=lambda x: (
+                x[1]["km"] is None,
+                downstream_position(water_shortname, x[1]["km"], RIVER_KM_DESCENDING) if x[1]["km"] is not None else 0,
+                x[1]["longname"]
+            )
         )
         
         # Generate README content
@@ -138,13 +147,18 @@ def generate_river_readmes(measurements: List[Dict[str, Any]]):
         logger.info(f"Generated river README at {readme_path}")
 
 
-def generate_station_readmes(measurements: List[Dict[str, Any]]):
+def generate_station_readmes(measurements: List[Dict[str, Any]], station_index: Optional[StationIndex] = None):
     """
     Generate README files for each station.
     
     Args:
         measurements: List of measurement data
+        station_index: Spatial index over the stations, built from the measurements if not given
     """
+    if station_index is None:
+        station_index = StationIndex()
+        station_index.update(measurements)
+
     # Group measurements by station
     stations = {}
     for measurement in measurements:
@@ -186,6 +200,19 @@ def generate_station_readmes(measurements: List[Dict[str, Any]]):
         content += "<WorldMap>\n"
         content += f"  <Marker lat=\"{latitude}\" lon=\"{longitude}\" labelTopic=\"{station_topic}/measurementValue\" />\n"
         content += "</WorldMap>\n"
+
+        if latitude is not None and longitude is not None:
+            nearby = station_index.nearest(latitude, longitude, NEARBY_GAUGES,
+                                           exclude=(water_shortname, station_shortname))
+            if nearby:
+                content += "\n## Nearby Gauges\n\n"
+                for distance, nearby_station in nearby:
+                    nearby_water = nearby_station["water_shortname"]
+                    nearby_shortname = nearby_station["station_shortname"]
+                    nearby_topic = sanitize_topic(f"{GCMB_ORG}/{GCMB_PROJECT}/{nearby_water}/{nearby_shortname}")
+                    link = f"../../{sanitize_topic(nearby_water)}/{sanitize_topic(nearby_shortname)}"
+                    content += (f"* [{nearby_station['water_longname']} - {nearby_shortname}]({link}) "
+                                f"({distance:.1f} km): <Value topic=\"{nearby_topic}/measurementValue\"/> cm\n")
         
         # Write README file
         readme_path = station_dir / "README.md"
@@ -214,10 +241,14 @@ def main():
         # Ensure base directory exists
         ensure_directory(GCMB_DIR)
         
+        # Build spatial index over the stations
+        station_index = StationIndex()
+        station_index.update(measurements)
+        
         # Generate README files
         generate_main_readme(measurements)
         generate_river_readmes(measurements)
-        generate_station_readmes(measurements)
+        generate_station_readmes(measurements, station_index)
         
         logger.info("Successfully generated all GCMB README files")
     except Exception as e:
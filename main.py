@@ -1,22 +1,41 @@
 from dotenv import load_dotenv
 
-from utils import sanitize_topic
+from utils import sanitize_topic, load_state, save_state
 
 load_dotenv()
 
 import os
 import logging
+import signal
 import sys
 import time
-from typing import Dict, Any, Optional
+import json
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Set, Tuple
 from gcmb_publisher import MqttPublisher
 from api_client import ApiClient
+from plausibility import PlausibilityFilter, parse_gauge_bounds
+from spatial_index import StationIndex
+from river_profile import RiverProfile, parse_descending_km_waters
+from tracing import Tracer, SamplingProfiler
+from publish_targets import PublishTarget, create_publish_target
 
 # Environment variables
 GCMB_ORG = os.environ.get('GCMB_ORG', 'rivers')
 GCMB_PROJECT = os.environ.get('GCMB_PROJECT', 'pegel-online')
 FETCH_INTERVAL = int(os.environ.get('FETCH_INTERVAL', '900'))  # Default: 15 minutes
 LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+PLAUSIBILITY_MAX_RATE = float(os.environ.get('PLAUSIBILITY_MAX_RATE', '100'))  # cm per hour
+PLAUSIBILITY_STUCK_HOURS = float(os.environ.get('PLAUSIBILITY_STUCK_HOURS', '72'))
+PLAUSIBILITY_MIN_VALUE = float(os.environ.get('PLAUSIBILITY_MIN_VALUE', '-1000'))  # cm
+PLAUSIBILITY_MAX_VALUE = float(os.environ.get('PLAUSIBILITY_MAX_VALUE', '3000'))  # cm
+PLAUSIBILITY_GAUGE_BOUNDS = json.loads(os.environ.get('PLAUSIBILITY_GAUGE_BOUNDS', '{}'))  # {"WATER/STATION": [min, max]}
+STATE_DIR = os.environ.get('STATE_DIR', '')  # State is kept in memory only if empty
+RIVER_KM_DESCENDING = parse_descending_km_waters(os.environ.get('RIVER_KM_DESCENDING', ''))  # Comma-separated waters
+TRACE_DIR = os.environ.get('TRACE_DIR', '')  # Tracing is disabled if empty
+TRACE_KEEP = int(os.environ.get('TRACE_KEEP', '96'))
+API_DECODER = os.environ.get('API_DECODER', 'typed')  # typed or generic
+PUBLISH_TARGETS = json.loads(os.environ.get('PUBLISH_TARGETS', '[]'))  # Additional targets, see README
 
 # Configure logging
 print(f"Using log level: {LOG_LEVEL}")
@@ -35,7 +54,13 @@ class Adapter:
     Adapter for fetching data from Pegel Online API and publishing to MQTT.
     """
 
-    def __init__(self, gcmb_org: str, gcmb_project: str, fetch_interval: int = 300):
+    def __init__(self, gcmb_org: str, gcmb_project: str, fetch_interval: int = 300,
+                 publish_targets: Optional[List[Dict[str, Any]]] = None,
+                 plausibility_max_rate: float = 100.0, plausibility_stuck_hours: float = 72.0,
+                 plausibility_min_value: float = -1000.0, plausibility_max_value: float = 3000.0,
+                 gauge_bounds: Optional[Dict[str, List[float]]] = None, state_dir: Optional[str] = None,
+                 river_km_descending: Optional[Set[str]] = None, trace_dir: Optional[str] = None,
+                 trace_keep: int = 96, api_decoder: str = "typed"):
         """
         Initialize the adapter.
 
@@ -43,16 +68,65 @@ class Adapter:
             gcmb_org: GCMB organization
             gcmb_project: GCMB project
             fetch_interval: Interval between fetches in seconds
+            publish_targets: Configurations of additional publish targets
+            plausibility_max_rate: Maximum plausible rate of change in cm per hour
+            plausibility_stuck_hours: Number of hours after which an unchanged value is considered stuck
+            plausibility_min_value: Lower bound for measurement values in cm
+            plausibility_max_value: Upper bound for measurement values in cm
+            gauge_bounds: Per-gauge bounds for the plausibility check, keyed by "WATER/STATION"
+            state_dir: Directory for state that is kept across restarts, kept in memory only if empty
+            river_km_descending: Waters whose river kilometre is counted from the mouth,
+                defaults to DESCENDING_KM_WATERS
+            trace_dir: Directory for trace and profile files, tracing is disabled if empty
+            trace_keep: Number of trace files to keep
+            api_decoder: Decoder for the stations response, "typed" or "generic"
         """
         self.gcmb_org = gcmb_org
         self.gcmb_project = gcmb_project
         self.fetch_interval = fetch_interval
         self.base_topic = f"{gcmb_org}/{gcmb_project}"
-        self.api_client = ApiClient()
-        self.mqtt_publisher = MqttPublisher(enable_watchdog=True)
+        self.trace_dir = trace_dir
+        self.tracer = Tracer(trace_dir, keep=trace_keep)
+        self.profile_next_cycle = False
+        self.api_client = ApiClient(tracer=self.tracer, decoder=api_decoder)
+        # The watchdog restarts the process if nothing was published for a while,
+        # which must be longer than the pause between two cycles
+        watchdog_minutes = max(10, 2 * fetch_interval / 60)
+        mqtt_publisher = MqttPublisher(enable_watchdog=True, watchdog_minutes=watchdog_minutes)
+        self.targets = [PublishTarget("default", self.base_topic, mqtt_publisher, max_silence=watchdog_minutes * 60)]
+        for config in publish_targets or []:
+            # A misconfigured additional target must not prevent publishing to the others
+            try:
+                self.targets.append(create_publish_target(config, mqtt_publisher, max_silence=watchdog_minutes * 60))
+            except Exception as e:
+                logger.error(f"Error creating publish target {config.get('name', config)}, skipping it: {e}")
+        self.plausibility_filter = PlausibilityFilter(
+            max_rate=plausibility_max_rate,
+            stuck_hours=plausibility_stuck_hours,
+            min_value=plausibility_min_value,
+            max_value=plausibility_max_value,
+            gauge_bounds=parse_gauge_bounds(gauge_bounds or {})
+        )
+        self.station_index = StationIndex()
+        self.river_profile = RiverProfile(descending_km_waters=river_km_descending)
+        self.state_dir = Path(state_dir) if state_dir else None
+        self._load_state()
 
         logger.info(f"Initialized Adapter with base topic: {self.base_topic}")
         logger.info(f"Fetch interval: {self.fetch_interval} seconds")
+        for target in self.targets[1:]:
+            logger.info(f"Additional publish target {target.name} with base topic: {target.base_topic}")
+
+    @property
+    def mqtt_publisher(self):
+        """
+        Publisher of the default target.
+        """
+        return self.targets[0].publisher
+
+    @mqtt_publisher.setter
+    def mqtt_publisher(self, publisher):
+        self.targets[0].publisher = publisher
 
     def run(self):
         """
@@ -61,11 +135,26 @@ class Adapter:
         """
         logger.info("Starting adapter main loop")
 
+        # kill -USR1 <pid> profiles the next cycle
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, self._request_profile)
+
         while True:
+            profiler = None
+            if self.profile_next_cycle:
+                self.profile_next_cycle = False
+                profiler = SamplingProfiler()
+                profiler.start()
+
+            self.tracer.start_cycle()
             try:
                 self._fetch_and_publish()
             except Exception as e:
                 logger.error(f"Error in fetch and publish cycle: {e}")
+            finally:
+                self.tracer.end_cycle()
+                if profiler is not None:
+                    profiler.stop(self.trace_dir)
 
             logger.debug(f"Sleeping for {self.fetch_interval} seconds")
             time.sleep(self.fetch_interval)
@@ -78,56 +167,183 @@ class Adapter:
 
         try:
             # Fetch stations from API
-            stations = self.api_client.get_stations()
+            with self.tracer.span("fetch"):
+                stations = self.api_client.get_stations()
 
             # Extract measurement data
-            measurements = self.api_client.extract_measurement_data(stations)
+            with self.tracer.span("extract") as span:
+                measurements = self.api_client.extract_measurement_data(stations)
+                span["measurements"] = len(measurements)
+
+            # Keep the spatial index in sync with the station set
+            with self.tracer.span("station_index"):
+                self.station_index.update(measurements)
+
+            # Quarantine implausible values
+            with self.tracer.span("plausibility"):
+                measurements = self.plausibility_filter.apply(measurements)
 
-            # Publish measurements
-            self._publish_measurements(measurements)
+            # River profiles and travel times for waters with changed levels
+            with self.tracer.span("river_profile"):
+                profile_messages = self._river_profile_messages(measurements)
+
+            # Publish to all targets
+            with self.tracer.span("publish") as span:
+                span["targets"] = self._publish(self._measurement_messages(measurements) + profile_messages)
+
+            self._save_state()
 
             logger.info(f"Successfully published {len(measurements)} measurements")
         except Exception as e:
             logger.error(f"Error fetching or publishing data: {e}")
             raise
 
-    def _publish_measurements(self, measurements):
+    def _load_state(self):
+        """
+        Restore the plausibility history and the river profile from the state directory.
+        """
+        if self.state_dir is None:
+            return
+
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        state = load_state(self.state_dir / "plausibility.json")
+        if state is not None:
+            self.plausibility_filter.load_state(state)
+        state = load_state(self.state_dir / "river_profile.json")
+        if state is not None:
+            self.river_profile.load_state(state)
+
+    def _save_state(self):
+        """
+        Save the plausibility history and the river profile to the state directory.
         """
-        Publish measurements to MQTT.
+        if self.state_dir is None:
+            return
+
+        save_state(self.state_dir / "plausibility.json", self.plausibility_filter.dump_state())
+        save_state(self.state_dir / "river_profile.json", self.river_profile.dump_state())
+
+    def _request_profile(self, signum, frame):
+        """
+        Signal handler requesting a profile of the next cycle.
+        """
+        logger.info("Profiling the next fetch and publish cycle")
+        self.profile_next_cycle = True
+
+    def find_nearby_gauges(self, latitude: float, longitude: float,
+                           radius_km: float) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Find gauges within a radius around a point.
+        Uses the stations seen in the last fetch cycle.
+
+        Args:
+            latitude: Latitude of the point in degrees
+            longitude: Longitude of the point in degrees
+            radius_km: Radius in km
+
+        Returns:
+            List of (distance in km, station) tuples, sorted by distance
+        """
+        return self.station_index.within(latitude, longitude, radius_km)
+
+    def _publish(self, messages: List[Tuple[str, str, str]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Queue messages for publishing on all targets.
+
+        Args:
+            messages: List of (water_shortname, topic relative to the base topic, payload)
+
+        Returns:
+            Stats of the targets, keyed by target name
+        """
+        all_stats = {}
+        for target in self.targets:
+            target.publish(messages)
+
+            stats = target.stats()
+            all_stats[target.name] = stats
+            if stats["unhealthy_cycles"]:
+                logger.warning(f"Publish target {target.name} has not published for "
+                               f"{stats['seconds_since_success']} seconds, {stats['queue_size']} messages queued, "
+                               f"unhealthy for {stats['unhealthy_cycles']} cycles")
+            elif len(self.targets) > 1:
+                logger.info(f"Publish target {target.name}: {stats['queued']} queued, {stats['dropped']} dropped, "
+                            f"{stats['queue_size']} waiting, latency {stats['latency_seconds']} seconds")
+
+        # The stats of the targets are published on the default target, so they can be monitored
+        if len(self.targets) > 1 and not self.mqtt_publisher.msg_queue.full():
+            self.mqtt_publisher.send_msg(json.dumps(all_stats), f"{sanitize_topic(self.base_topic)}/publishTargets",
+                                         retain=True)
+        return all_stats
+
+    def _measurement_messages(self, measurements) -> List[Tuple[str, str, str]]:
+        """
+        Build the messages for measurements.
 
         Args:
             measurements: List of measurement data
+
+        Returns:
+            List of (water_shortname, topic relative to the base topic, payload)
         """
+        messages = []
+
         for measurement in measurements:
             water_shortname = measurement["water_shortname"]
             station_shortname = measurement["station_shortname"]
 
-            # Base topic for this measurement
-            measurement_base_topic = sanitize_topic(f"{self.base_topic}/{water_shortname}/{station_shortname}")
+            # Topic for this measurement, relative to the base topic of the target
+            measurement_topic = sanitize_topic(f"{water_shortname}/{station_shortname}")
 
             # Publish measurement value
             if measurement["measurement_value"] is not None:
-                self.mqtt_publisher.send_msg(
-                    str(measurement["measurement_value"]),
-                    f"{measurement_base_topic}/measurementValue",
-                    retain=True
-                )
+                messages.append((water_shortname, f"{measurement_topic}/measurementValue",
+                                 str(measurement["measurement_value"])))
 
             # Publish state_mnw_mhw if available
             if measurement["state_mnw_mhw"] is not None:
-                self.mqtt_publisher.send_msg(
-                    measurement["state_mnw_mhw"],
-                    f"{measurement_base_topic}/stateMnwMhw",
-                    retain=True
-                )
+                messages.append((water_shortname, f"{measurement_topic}/stateMnwMhw",
+                                 measurement["state_mnw_mhw"]))
 
             # Publish state_nsw_hsw if available
             if measurement["state_nsw_hsw"] is not None:
-                self.mqtt_publisher.send_msg(
-                    measurement["state_nsw_hsw"],
-                    f"{measurement_base_topic}/stateNswHsw",
-                    retain=True
-                )
+                messages.append((water_shortname, f"{measurement_topic}/stateNswHsw",
+                                 measurement["state_nsw_hsw"]))
+
+            # Publish quality flag if the value was checked
+            if measurement.get("quality") is not None:
+                messages.append((water_shortname, f"{measurement_topic}/quality",
+                                 measurement["quality"]))
+
+        return messages
+
+    def _river_profile_messages(self, measurements) -> List[Tuple[str, str, str]]:
+        """
+        Update the river profile and build the messages for waters and stations that changed.
+
+        Args:
+            measurements: List of measurement data
+
+        Returns:
+            List of (water_shortname, topic relative to the base topic, payload)
+        """
+        changed_waters, changed_travel_times = self.river_profile.update(measurements)
+        messages = []
+
+        for water_shortname in changed_waters:
+            profile = self.river_profile.profile(water_shortname)
+            if not profile:
+                continue
+            messages.append((water_shortname, sanitize_topic(f"{water_shortname}/profile"), json.dumps(profile)))
+
+        for water_shortname, station_shortname in changed_travel_times:
+            minutes = self.river_profile.travel_times[(water_shortname, station_shortname)]
+            messages.append((water_shortname,
+                             sanitize_topic(f"{water_shortname}/{station_shortname}/travelTimeFromUpstream"),
+                             str(round(minutes))))
+
+        logger.debug("Built %d river profile and travel time messages", len(messages))
+        return messages
 
 
 def main():
@@ -137,7 +353,18 @@ def main():
     adapter = Adapter(
         gcmb_org=GCMB_ORG,
         gcmb_project=GCMB_PROJECT,
-        fetch_interval=FETCH_INTERVAL
+        fetch_interval=FETCH_INTERVAL,
+        publish_targets=PUBLISH_TARGETS,
+        plausibility_max_rate=PLAUSIBILITY_MAX_RATE,
+        plausibility_stuck_hours=PLAUSIBILITY_STUCK_HOURS,
+        plausibility_min_value=PLAUSIBILITY_MIN_VALUE,
+        plausibility_max_value=PLAUSIBILITY_MAX_VALUE,
+        gauge_bounds=PLAUSIBILITY_GAUGE_BOUNDS,
+        state_dir=STATE_DIR,
+        river_km_descending=RIVER_KM_DESCENDING,
+        trace_dir=TRACE_DIR,
+        trace_keep=TRACE_KEEP,
+        api_decoder=API_DECODER
     )
     adapter.run()
 
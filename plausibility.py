@@ -0,0 +1,186 @@
+import logging
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+from utils import parse_timestamp, format_timestamp
+
+logger = logging.getLogger(__name__)
+
+QUALITY_OK = "ok"
+QUALITY_SPIKE = "spike"
+QUALITY_STUCK = "stuck"
+QUALITY_OUT_OF_RANGE = "out_of_range"
+
+
+def parse_gauge_bounds(config: Dict[str, List[float]]) -> Dict[Tuple[str, str], Tuple[float, float]]:
+    """
+    Parse per-gauge bounds from their configuration.
+
+    Args:
+        config: Bounds keyed by "WATER/STATION", e.g. {"ALLER/CELLE": [0, 1000]}
+
+    Returns:
+        Bounds keyed by (water_shortname, station_shortname)
+    """
+    gauge_bounds = {}
+    for gauge, (min_value, max_value) in config.items():
+        water_shortname, station_shortname = gauge.split("/", 1)
+        gauge_bounds[(water_shortname, station_shortname)] = (float(min_value), float(max_value))
+    return gauge_bounds
+
+
+class PlausibilityFilter:
+    """
+    Plausibility filter for extracted measurements.
+    Flags sensor spikes, stuck gauges and out-of-range values before they get published.
+
+    The filter keeps a small, constant-size history per station (the last few readings,
+    the last accepted value and the start of the current constant run). Readings are checked
+    against the median of the recent readings, so a single bad reading can neither pass
+    as a baseline nor cause the following good readings to be rejected.
+    """
+
+    def __init__(self,
+                 max_rate: float = 100.0,
+                 stuck_hours: float = 72.0,
+                 min_value: float = -1000.0,
+                 max_value: float = 3000.0,
+                 window: int = 5,
+                 min_readings: int = 3,
+                 gauge_bounds: Optional[Dict[Tuple[str, str], Tuple[float, float]]] = None):
+        """
+        Initialize the plausibility filter.
+
+        Args:
+            max_rate: Maximum plausible rate of change in cm per hour
+            stuck_hours: Number of hours after which an unchanged value is considered stuck
+            min_value: Default lower bound for measurement values in cm
+            max_value: Default upper bound for measurement values in cm
+            window: Number of recent readings per station the median is taken from
+            min_readings: Number of readings needed before the rate of change is checked
+            gauge_bounds: Per-gauge bounds, keyed by (water_shortname, station_shortname)
+        """
+        self.max_rate = max_rate
+        self.stuck_hours = stuck_hours
+        self.min_value = min_value
+        self.max_value = max_value
+        self.window = window
+        self.min_readings = min_readings
+        self.gauge_bounds = gauge_bounds or {}
+        self.history: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def apply(self, measurements: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Check all measurements against the per-station history.
+
+        Every measurement with a value gets a "quality" entry. Suspect values are
+        quarantined by setting "measurement_value" to None, so they are not published.
+
+        Args:
+            measurements: List of measurement data
+
+        Returns:
+            The same list of measurement data, annotated with the quality flag
+        """
+        quarantined = 0
+
+        for measurement in measurements:
+            value = measurement["measurement_value"]
+            if value is None:
+                continue
+
+            key = (measurement["water_shortname"], measurement["station_shortname"])
+            quality = self._check(key, value, parse_timestamp(measurement.get("timestamp")))
+            measurement["quality"] = quality
+
+            if quality != QUALITY_OK:
+                measurement["measurement_value"] = None
+                quarantined += 1
+                logger.debug("Quarantined value %s of %s/%s: %s", value, key[0], key[1], quality)
+
+        if quarantined:
+            logger.info(f"Quarantined {quarantined} suspect measurements")
+        return measurements
+
+    def dump_state(self) -> List[Dict[str, Any]]:
+        """
+        Serialize the per-station history.
+
+        Returns:
+            JSON-serializable list with one entry per station
+        """
+        return [
+            {
+                "water": water_shortname,
+                "station": station_shortname,
+                "readings": [[value, format_timestamp(timestamp)] for value, timestamp in history["readings"]],
+                "value": history["value"],
+                "constant_since": format_timestamp(history["constant_since"])
+            }
+            for (water_shortname, station_shortname), history in self.history.items()
+        ]
+
+    def load_state(self, state: List[Dict[str, Any]]):
+        """
+        Restore the per-station history written by dump_state.
+
+        Args:
+            state: List with one entry per station
+        """
+        self.history = {
+            (entry["water"], entry["station"]): {
+                "readings": [(value, parse_timestamp(timestamp)) for value, timestamp in entry["readings"]],
+                "value": entry["value"],
+                "constant_since": parse_timestamp(entry["constant_since"])
+            }
+            for entry in state
+        }
+        logger.info(f"Restored plausibility history of {len(self.history)} stations")
+
+    def _check(self, key: Tuple[str, str], value: float, timestamp: Optional[datetime]) -> str:
+        """
+        Check a single value and update the station history.
+
+        Args:
+            key: (water_shortname, station_shortname)
+            value: Measurement value in cm
+            timestamp: Timestamp of the measurement, if known
+
+        Returns:
+            Quality flag
+        """
+        min_value, max_value = self.gauge_bounds.get(key, (self.min_value, self.max_value))
+        if value < min_value or value > max_value:
+            return QUALITY_OUT_OF_RANGE
+
+        history = self.history.get(key)
+        if history is None:
+            history = {"readings": [], "value": None, "constant_since": None}
+            self.history[key] = history
+
+        # Only record new readings, not the same reading fetched again
+        readings = history["readings"]
+        if timestamp is None or not readings or readings[-1][1] != timestamp:
+            readings.append((value, timestamp))
+            if len(readings) > self.window:
+                del readings[0]
+
+        # Rate of change against the median of the recent readings. A level that persists
+        # for the majority of the window moves the median and is accepted.
+        if len(readings) >= self.min_readings:
+            median_value, median_timestamp = sorted(readings, key=lambda reading: reading[0])[len(readings) // 2]
+            if timestamp is not None and median_timestamp is not None:
+                hours = (timestamp - median_timestamp).total_seconds() / 3600
+                if hours > 0 and abs(value - median_value) > self.max_rate * hours:
+                    return QUALITY_SPIKE
+
+        if value != history["value"]:
+            history["constant_since"] = timestamp
+        history["value"] = value
+
+        constant_since = history["constant_since"]
+        if timestamp is not None and constant_since is not None:
+            if (timestamp - constant_since).total_seconds() / 3600 >= self.stuck_hours:
+                return QUALITY_STUCK
+
+        return QUALITY_OK
@@ -0,0 +1,212 @@
+import logging
+import os
+import time
+from typing import Dict, List, Any, Optional, Tuple
+
+import paho.mqtt.client as mqtt
+from gcmb_publisher import MqttPublisher
+
+from utils import sanitize_topic
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CA_CERTS = '/etc/ssl/certs/ca-certificates.crt'
+
+
+class TargetMqttPublisher(MqttPublisher):
+    """
+    MqttPublisher with its own broker connection.
+    MqttPublisher reads the connection settings from the environment once per process,
+    this subclass allows additional publish targets to connect to other brokers.
+    """
+
+    def __init__(self, host: str, username: str, password: str, client_id: Optional[str] = None,
+                 port: int = 8883, ca_certs: str = DEFAULT_CA_CERTS, **kwargs):
+        """
+        Initialize the publisher and connect to the broker.
+
+        Args:
+            host: MQTT broker host
+            username: MQTT username
+            password: MQTT password
+            client_id: MQTT client ID, defaults to "{username}/pub"
+            port: MQTT broker port
+            ca_certs: Path of the CA certificates for verifying the broker
+            kwargs: Arguments passed on to MqttPublisher
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.client_id = client_id or f"{username}/pub"
+        self.ca_certs = ca_certs
+        super().__init__(**kwargs)
+
+    def _connect_mqtt(self):
+        def on_connect(client, userdata, flags, rc, properties):
+            if rc == 0:
+                logger.info(f"Connected to MQTT Broker {self.host}")
+            else:
+                logger.error(f"Failed to connect to {self.host}, return code {rc}")
+
+        mqtt_client = mqtt.Client(client_id=self.client_id,
+                                  callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+        mqtt_client.tls_set(ca_certs=self.ca_certs)
+        mqtt_client.username_pw_set(self.username, self.password)
+        mqtt_client.on_connect = on_connect
+        mqtt_client.on_disconnect = lambda client, userdata, disconnect_flags, reason_code, properties: logger.warning(
+            f"Disconnected from MQTT Broker {self.host}, return code {reason_code}")
+        # Connects on the client thread, which retries until the broker is reachable,
+        # so an unreachable broker does not fail the startup of the adapter
+        mqtt_client.connect_async(self.host, self.port)
+        return mqtt_client
+
+
+class PublishTarget:
+    """
+    A namespace on a broker that the adapter publishes to.
+    Messages are put on the queue of the target's publisher, which sends them on its own thread,
+    so a slow broker does not delay the other targets. Messages for a full queue are dropped
+    instead of blocking the cycle.
+    """
+
+    def __init__(self, name: str, base_topic: str, publisher, waters: Optional[List[str]] = None,
+                 max_silence: float = 600):
+        """
+        Initialize the publish target.
+
+        Args:
+            name: Name of the target, used in logs and stats
+            base_topic: Base topic, e.g. "rivers/pegel-online"
+            publisher: MqttPublisher of the target
+            waters: Short names of the waters to publish, all waters if None
+            max_silence: Seconds without a successful publish after which the target is unhealthy
+        """
+        self.name = name
+        self.base_topic = base_topic
+        self.publisher = publisher
+        self.waters = set(waters) if waters is not None else None
+        self.max_silence = max_silence
+        self.queued = 0
+        self.dropped = 0
+        self.unhealthy_cycles = 0
+        # Time at which the oldest cycle that was not completely sent yet started queueing
+        self.pending_since = None
+        self.latency = None
+
+    def publish(self, messages: List[Tuple[str, str, str]]):
+        """
+        Queue the messages of a cycle for publishing.
+
+        Args:
+            messages: List of (water_shortname, topic relative to the base topic, payload)
+        """
+        self._update_latency()
+
+        base_topic = sanitize_topic(self.base_topic)
+        msg_queue = self.publisher.msg_queue
+        queue_start = time.time()
+        queued = 0
+        dropped = 0
+
+        for water_shortname, topic, payload in messages:
+            if self.waters is not None and water_shortname not in self.waters:
+                continue
+            # send_msg blocks on a full queue
+            if msg_queue.full():
+                dropped += 1
+                continue
+            self.publisher.send_msg(payload, f"{base_topic}/{topic}", retain=True)
+            queued += 1
+
+        self.queued += queued
+        if queued and self.pending_since is None:
+            self.pending_since = queue_start
+        if dropped:
+            self.dropped += dropped
+            logger.warning(f"Queue of publish target {self.name} is full, dropped {dropped} messages")
+
+        self.unhealthy_cycles = 0 if self.healthy() else self.unhealthy_cycles + 1
+
+    def _update_latency(self):
+        """
+        Update the latency from queueing the messages of a cycle until the last of them was sent.
+        While messages are still queued, the latency is the age of the oldest cycle not sent completely.
+        """
+        if self.pending_since is None:
+            return
+
+        last_success = self.publisher.last_successful_message
+        if self.publisher.msg_queue.empty() and last_success is not None and last_success >= self.pending_since:
+            self.latency = last_success - self.pending_since
+            self.pending_since = None
+        else:
+            self.latency = time.time() - self.pending_since
+
+    def healthy(self) -> bool:
+        """
+        Check whether the publisher of the target sent a message within max_silence.
+
+        Returns:
+            True if the target is healthy
+        """
+        last_success = self.publisher.last_successful_message
+        since = last_success if last_success is not None else self.publisher.start_time
+        return time.time() - since <= self.max_silence
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters of the target and state of its publisher.
+
+        Returns:
+            Dict with queued and dropped message counts, the queue size of the publisher,
+            the seconds since its last successful publish, the latency of the previous cycle
+            and the number of consecutive unhealthy cycles
+        """
+        last_success = self.publisher.last_successful_message
+        return {
+            "queued": self.queued,
+            "dropped": self.dropped,
+            "queue_size": self.publisher.msg_queue.qsize(),
+            "seconds_since_success": round(time.time() - last_success, 3) if last_success is not None else None,
+            "latency_seconds": round(self.latency, 3) if self.latency is not None else None,
+            "unhealthy_cycles": self.unhealthy_cycles
+        }
+
+
+def create_publish_target(config: Dict[str, Any], default_publisher, max_silence: float = 600) -> PublishTarget:
+    """
+    Create a publish target from its configuration.
+
+    Args:
+        config: Target configuration with the keys "org", "project" and optionally "name", "waters",
+            "mqtt_host", "mqtt_port", "mqtt_username", "mqtt_password_env", "mqtt_client_id" and "mqtt_ca_certs".
+            Without "mqtt_host", the target shares the default publisher.
+        default_publisher: Publisher of the default target
+        max_silence: Seconds without a successful publish after which the target is unhealthy
+
+    Returns:
+        Publish target
+    """
+    base_topic = f"{config['org']}/{config['project']}"
+
+    if config.get("mqtt_host"):
+        # No watchdog, an unreachable additional broker must not restart the adapter
+        publisher = TargetMqttPublisher(
+            host=config["mqtt_host"],
+            port=int(config.get("mqtt_port", 8883)),
+            username=config["mqtt_username"],
+            password=os.environ[config["mqtt_password_env"]],
+            client_id=config.get("mqtt_client_id"),
+            ca_certs=config.get("mqtt_ca_certs", DEFAULT_CA_CERTS)
+        )
+    else:
+        publisher = default_publisher
+
+    return PublishTarget(
+        name=config.get("name", base_topic),
+        base_topic=base_topic,
+        publisher=publisher,
+        waters=config.get("waters"),
+        max_silence=max_silence
+    )
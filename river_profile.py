@@ -0,0 +1,253 @@
+import bisect
+import logging
+from typing import Dict, List, Any, Optional, Set, Tuple
+
+from utils import parse_timestamp, format_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Waters whose river kilometre decreases downstream because it is counted from the mouth
+DESCENDING_KM_WATERS = {"DONAU", "MAIN", "NECKAR", "MOSEL", "SAAR", "SAALE"}
+
+
+def parse_descending_km_waters(config: str) -> Set[str]:
+    """
+    Parse the waters whose river kilometre is counted from the mouth.
+
+    Args:
+        config: Comma-separated short names of the waters, the defaults are used if empty
+
+    Returns:
+        Set of water short names
+    """
+    if not config:
+        return set(DESCENDING_KM_WATERS)
+    return {water_shortname.strip() for water_shortname in config.split(",") if water_shortname.strip()}
+
+
+def downstream_position(water_shortname: str, km: float, descending_km_waters: Set[str] = DESCENDING_KM_WATERS) -> float:
+    """
+    Position of a station along its water, increasing from upstream to downstream.
+
+    Args:
+        water_shortname: Short name of the water
+        km: River kilometre of the station
+        descending_km_waters: Waters whose river kilometre is counted from the mouth
+
+    Returns:
+        Sort key for ordering stations upstream to downstream
+    """
+    return -km if water_shortname in descending_km_waters else km
+
+
+class RiverProfile:
+    """
+    Ordered index of stations along each water.
+    Keeps the latest level per station and estimates how long level changes take
+    to travel from one gauge to the next one downstream.
+    """
+
+    def __init__(self, change_threshold: float = 5.0, max_travel_hours: float = 48.0, smoothing: float = 0.3,
+                 descending_km_waters: Optional[Set[str]] = None):
+        """
+        Initialize the river profile.
+
+        Args:
+            change_threshold: Minimum change between two readings in cm to count as a level change
+            max_travel_hours: Maximum plausible travel time between neighbouring gauges in hours
+            smoothing: Weight of a new travel time observation in the moving average
+            descending_km_waters: Waters whose river kilometre is counted from the mouth,
+                defaults to DESCENDING_KM_WATERS
+        """
+        self.change_threshold = change_threshold
+        self.max_travel_hours = max_travel_hours
+        self.smoothing = smoothing
+        self.descending_km_waters = descending_km_waters if descending_km_waters is not None else DESCENDING_KM_WATERS
+        # water_shortname -> sorted list of (position, station_shortname)
+        self.order: Dict[str, List[Tuple[float, str]]] = {}
+        # (water_shortname, station_shortname) -> station state
+        self.stations: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # (water_shortname, downstream station_shortname) -> travel time from upstream neighbour in minutes
+        self.travel_times: Dict[Tuple[str, str], float] = {}
+
+    def update(self, measurements: List[Dict[str, Any]]) -> Tuple[List[str], List[Tuple[str, str]]]:
+        """
+        Apply the measurements of one cycle.
+        Only stations whose position or level changed are processed further.
+
+        Args:
+            measurements: List of measurement data
+
+        Returns:
+            Tuple of (waters whose profile changed, (water, station) keys whose travel time changed)
+        """
+        seen = set()
+        changed_waters = set()
+        changed_travel_times = []
+
+        for measurement in measurements:
+            # Stations without a numeric river kilometre cannot be placed on the profile
+            km = measurement.get("km")
+            if not isinstance(km, (int, float)):
+                continue
+
+            water_shortname = measurement["water_shortname"]
+            key = (water_shortname, measurement["station_shortname"])
+            if key in seen:
+                continue
+            seen.add(key)
+
+            position = downstream_position(water_shortname, km, self.descending_km_waters)
+            station = self.stations.get(key)
+            if station is None or station["position"] != position:
+                if station is not None:
+                    self._remove(key)
+                station = {"position": position, "km": km, "value": None, "timestamp": None,
+                           "change_timestamp": None, "change_sign": 0}
+                self._insert(key, station)
+                changed_waters.add(water_shortname)
+
+            value = measurement["measurement_value"]
+            if value is None or value == station["value"]:
+                continue
+
+            changed_waters.add(water_shortname)
+            timestamp = parse_timestamp(measurement.get("timestamp"))
+            previous = station["value"]
+            station["value"] = value
+            station["timestamp"] = timestamp
+
+            if previous is None or timestamp is None or abs(value - previous) < self.change_threshold:
+                continue
+
+            station["change_timestamp"] = timestamp
+            station["change_sign"] = 1 if value > previous else -1
+            if self._update_travel_time(key, station):
+                changed_travel_times.append(key)
+
+        removed = [key for key in self.stations if key not in seen]
+        for key in removed:
+            self._remove(key)
+            changed_waters.add(key[0])
+
+        return sorted(changed_waters), changed_travel_times
+
+    def profile(self, water_shortname: str) -> List[Dict[str, Any]]:
+        """
+        Longitudinal profile of a water.
+
+        Args:
+            water_shortname: Short name of the water
+
+        Returns:
+            List of {"station": str, "km": float, "value": float} ordered upstream to downstream
+        """
+        result = []
+        for position, station_shortname in self.order.get(water_shortname, []):
+            station = self.stations[(water_shortname, station_shortname)]
+            result.append({"station": station_shortname, "km": station["km"], "value": station["value"]})
+        return result
+
+    def upstream_neighbour(self, key: Tuple[str, str]) -> Optional[str]:
+        """
+        Get the next station upstream on the same water.
+
+        Args:
+            key: (water_shortname, station_shortname)
+
+        Returns:
+            Short name of the upstream station or None
+        """
+        order = self.order.get(key[0], [])
+        index = bisect.bisect_left(order, (self.stations[key]["position"], key[1]))
+        return order[index - 1][1] if index > 0 else None
+
+    def dump_state(self) -> Dict[str, Any]:
+        """
+        Serialize the station states and travel times.
+
+        Returns:
+            JSON-serializable dict with "stations" and "travel_times"
+        """
+        return {
+            "stations": [
+                {
+                    "water": water_shortname,
+                    "station": station_shortname,
+                    "position": station["position"],
+                    "km": station["km"],
+                    "value": station["value"],
+                    "timestamp": format_timestamp(station["timestamp"]),
+                    "change_timestamp": format_timestamp(station["change_timestamp"]),
+                    "change_sign": station["change_sign"]
+                }
+                for (water_shortname, station_shortname), station in self.stations.items()
+            ],
+            "travel_times": [[water_shortname, station_shortname, minutes]
+                             for (water_shortname, station_shortname), minutes in self.travel_times.items()]
+        }
+
+    def load_state(self, state: Dict[str, Any]):
+        """
+        Restore the station states and travel times written by dump_state.
+
+        Args:
+            state: Dict with "stations" and "travel_times"
+        """
+        self.order = {}
+        self.stations = {}
+        for entry in state["stations"]:
+            self._insert((entry["water"], entry["station"]), {
+                "position": entry["position"],
+                "km": entry["km"],
+                "value": entry["value"],
+                "timestamp": parse_timestamp(entry["timestamp"]),
+                "change_timestamp": parse_timestamp(entry["change_timestamp"]),
+                "change_sign": entry["change_sign"]
+            })
+        self.travel_times = {(water_shortname, station_shortname): minutes
+                             for water_shortname, station_shortname, minutes in state["travel_times"]}
+        logger.info(f"Restored river profile of {len(self.stations)} stations")
+
+    def _update_travel_time(self, key: Tuple[str, str], station: Dict[str, Any]) -> bool:
+        """
+        Match a level change with the last change of the upstream neighbour.
+
+        Args:
+            key: (water_shortname, station_shortname) of the station that changed
+            station: Station state
+
+        Returns:
+            True if the travel time estimate was updated
+        """
+        upstream_shortname = self.upstream_neighbour(key)
+        if upstream_shortname is None:
+            return False
+
+        upstream = self.stations[(key[0], upstream_shortname)]
+        if upstream["change_sign"] != station["change_sign"] or upstream["change_timestamp"] is None:
+            return False
+
+        minutes = (station["change_timestamp"] - upstream["change_timestamp"]).total_seconds() / 60
+        if minutes <= 0 or minutes > self.max_travel_hours * 60:
+            return False
+
+        previous = self.travel_times.get(key)
+        if previous is None:
+            self.travel_times[key] = minutes
+        else:
+            self.travel_times[key] = previous + self.smoothing * (minutes - previous)
+        logger.debug("Travel time %s -> %s on %s: %.0f min", upstream_shortname, key[1], key[0], self.travel_times[key])
+        return True
+
+    def _insert(self, key: Tuple[str, str], station: Dict[str, Any]):
+        self.stations[key] = station
+        bisect.insort(self.order.setdefault(key[0], []), (station["position"], key[1]))
+
+    def _remove(self, key: Tuple[str, str]):
+        station = self.stations.pop(key)
+        order = self.order[key[0]]
+        order.pop(bisect.bisect_left(order, (station["position"], key[1])))
+        if not order:
+            del self.order[key[0]]
+        self.travel_times.pop(key, None)
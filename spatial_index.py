@@ -0,0 +1,203 @@
+import logging
+import math
+from typing import Dict, List, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Great-circle distance between two points.
+
+    Args:
+        lat1: Latitude of the first point in degrees
+        lon1: Longitude of the first point in degrees
+        lat2: Latitude of the second point in degrees
+        lon2: Longitude of the second point in degrees
+
+    Returns:
+        Distance in km
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class StationIndex:
+    """
+    Grid-based spatial index over stations.
+    Stations are bucketed into cells of a fixed size in degrees, so lookups only
+    look at the cells around the query point instead of all stations.
+    """
+
+    def __init__(self, cell_size: float = 0.5):
+        """
+        Initialize the station index.
+
+        Args:
+            cell_size: Size of a grid cell in degrees
+        """
+        self.cell_size = cell_size
+        self.stations: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.cells: Dict[Tuple[int, int], Dict[Tuple[str, str], Dict[str, Any]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.stations)
+
+    def update(self, measurements: List[Dict[str, Any]]):
+        """
+        Update the index from measurement data.
+        Only stations that were added, moved or removed since the last update are touched.
+
+        Args:
+            measurements: List of measurement data
+        """
+        seen = set()
+        added = 0
+        moved = 0
+
+        for measurement in measurements:
+            latitude = measurement["latitude"]
+            longitude = measurement["longitude"]
+            if latitude is None or longitude is None:
+                continue
+
+            key = (measurement["water_shortname"], measurement["station_shortname"])
+            if key in seen:
+                continue
+            seen.add(key)
+
+            station = self.stations.get(key)
+            if station is not None:
+                if station["latitude"] == latitude and station["longitude"] == longitude:
+                    continue
+                self._remove(key)
+                moved += 1
+            else:
+                added += 1
+
+            self._insert(key, {
+                "water_shortname": measurement["water_shortname"],
+                "water_longname": measurement["water_longname"],
+                "station_shortname": measurement["station_shortname"],
+                "station_longname": measurement["station_longname"],
+                "latitude": latitude,
+                "longitude": longitude
+            })
+
+        removed = [key for key in self.stations if key not in seen]
+        for key in removed:
+            self._remove(key)
+
+        if added or moved or removed:
+            logger.debug(f"Updated station index: {added} added, {moved} moved, {len(removed)} removed")
+
+    def within(self, latitude: float, longitude: float, radius_km: float) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Find all stations within a radius around a point.
+
+        Args:
+            latitude: Latitude of the point in degrees
+            longitude: Longitude of the point in degrees
+            radius_km: Radius in km
+
+        Returns:
+            List of (distance in km, station) tuples, sorted by distance
+        """
+        lat_cells = math.ceil(radius_km / KM_PER_DEGREE / self.cell_size)
+        max_lat = min(abs(latitude) + radius_km / KM_PER_DEGREE, 89.0)
+        lon_cells = math.ceil(radius_km / (KM_PER_DEGREE * math.cos(math.radians(max_lat))) / self.cell_size)
+
+        ci, cj = self._cell(latitude, longitude)
+        result = []
+        for i in range(ci - lat_cells, ci + lat_cells + 1):
+            for j in range(cj - lon_cells, cj + lon_cells + 1):
+                for station in self.cells.get((i, j), {}).values():
+                    distance = haversine_km(latitude, longitude, station["latitude"], station["longitude"])
+                    if distance <= radius_km:
+                        result.append((distance, station))
+
+        result.sort(key=lambda x: x[0])
+        return result
+
+    def nearest(self, latitude: float, longitude: float, k: int = 5,
+                exclude: Optional[Tuple[str, str]] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Find the k nearest stations to a point.
+        Searches rings of cells around the point until no closer station can be found.
+
+        Args:
+            latitude: Latitude of the point in degrees
+            longitude: Longitude of the point in degrees
+            k: Number of stations to return
+            exclude: Key (water_shortname, station_shortname) of a station to leave out
+
+        Returns:
+            List of (distance in km, station) tuples, sorted by distance
+        """
+        total = len(self.stations) - (1 if exclude in self.stations else 0)
+        k = min(k, total)
+        if k <= 0:
+            return []
+
+        ci, cj = self._cell(latitude, longitude)
+        candidates = []
+        visited = 0
+        ring = 0
+
+        while True:
+            for cell in self._ring(ci, cj, ring):
+                for key, station in self.cells.get(cell, {}).items():
+                    if key == exclude:
+                        continue
+                    visited += 1
+                    distance = haversine_km(latitude, longitude, station["latitude"], station["longitude"])
+                    candidates.append((distance, station))
+
+            if visited >= total:
+                break
+
+            # Stations outside the searched rings are at least this far away
+            if len(candidates) >= k:
+                candidates.sort(key=lambda x: x[0])
+                max_lat = min(abs(latitude) + (ring + 1) * self.cell_size, 89.0)
+                bound = ring * self.cell_size * KM_PER_DEGREE * math.cos(math.radians(max_lat))
+                if candidates[k - 1][0] <= bound:
+                    break
+
+            ring += 1
+
+        candidates.sort(key=lambda x: x[0])
+        return candidates[:k]
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size)
+
+    @staticmethod
+    def _ring(ci: int, cj: int, ring: int) -> List[Tuple[int, int]]:
+        if ring == 0:
+            return [(ci, cj)]
+        cells = []
+        for j in range(cj - ring, cj + ring + 1):
+            cells.append((ci - ring, j))
+            cells.append((ci + ring, j))
+        for i in range(ci - ring + 1, ci + ring):
+            cells.append((i, cj - ring))
+            cells.append((i, cj + ring))
+        return cells
+
+    def _insert(self, key: Tuple[str, str], station: Dict[str, Any]):
+        self.stations[key] = station
+        self.cells.setdefault(self._cell(station["latitude"], station["longitude"]), {})[key] = station
+
+    def _remove(self, key: Tuple[str, str]):
+        station = self.stations.pop(key)
+        cell = self._cell(station["latitude"], station["longitude"])
+        del self.cells[cell][key]
+        if not self.cells[cell]:
+            del self.cells[cell]
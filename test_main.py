@@ -1,9 +1,17 @@
 import pytest
 from unittest.mock import MagicMock, patch
 import json
+import queue
+import signal
+import time
 from pathlib import Path
 
+import paho.mqtt.client as mqtt
+
 from main import Adapter
+from api_client import ApiClient
+from plausibility import PlausibilityFilter
+from tracing import SamplingProfiler
 from utils.mock_mqtt_publisher import MockMqttPublisher
 
 
@@ -146,7 +154,7 @@ def test_publish_measurements(sample_measurements):
     adapter.mqtt_publisher = mock_publisher
     
     # Call the method to publish measurements
-    adapter._publish_measurements(sample_measurements)
+    adapter._publish(adapter._measurement_messages(sample_measurements))
     
     # Check that the correct messages were published
     messages = mock_publisher.get_all_messages()
@@ -209,8 +217,8 @@ def test_fetch_and_publish(mock_api_client_class, sample_stations, sample_measur
     # Check that the correct messages were published
     messages = mock_publisher.get_all_messages()
     
-    # Should have 6 messages (3 per measurement)
-    assert len(messages) == 6
+    # Should have 8 messages (3 per measurement plus quality flag)
+    assert len(messages) == 8
     
     # Check that all expected topics were published to
     topics = mock_publisher.get_all_topics()
@@ -220,7 +228,9 @@ def test_fetch_and_publish(mock_api_client_class, sample_stations, sample_measur
         "rivers/pegel-online/ALLER/CELLE/stateNswHsw",
         "rivers/pegel-online/ALLER/MARKLENDORF/measurementValue",
         "rivers/pegel-online/ALLER/MARKLENDORF/stateMnwMhw",
-        "rivers/pegel-online/ALLER/MARKLENDORF/stateNswHsw"
+        "rivers/pegel-online/ALLER/MARKLENDORF/stateNswHsw",
+        "rivers/pegel-online/ALLER/CELLE/quality",
+        "rivers/pegel-online/ALLER/MARKLENDORF/quality"
     ]
     
     for topic in expected_topics:
@@ -257,7 +267,7 @@ def test_handle_missing_data():
     adapter.mqtt_publisher = mock_publisher
     
     # Call the method to publish measurements
-    adapter._publish_measurements(measurements)
+    adapter._publish(adapter._measurement_messages(measurements))
     
     # Check that only the available data was published
     messages = mock_publisher.get_all_messages()
@@ -269,4 +279,521 @@ def test_handle_missing_data():
     topics = mock_publisher.get_all_topics()
     assert "rivers/pegel-online/ALLER/CELLE/stateMnwMhw" in topics
     assert "rivers/pegel-online/ALLER/CELLE/measurementValue" not in topics
-    assert "rivers/pegel-online/ALLER/CELLE/stateNswHsw" not in topics
\ No newline at end of file
+    assert "rivers/pegel-online/ALLER/CELLE/stateNswHsw" not in topics
+
+
+def _celle_measurement(value, timestamp):
+    """
+    Helper creating a measurement for CELLE with the given value and timestamp.
+    """
+    return {
+        "water_shortname": "ALLER",
+        "water_longname": "ALLER",
+        "station_shortname": "CELLE",
+        "station_longname": "CELLE",
+        "latitude": 52.62270553213209,
+        "longitude": 10.062164093638698,
+        "measurement_value": value,
+        "timestamp": timestamp,
+        "state_mnw_mhw": "low",
+        "state_nsw_hsw": "normal"
+    }
+
+
+def test_plausibility_filter_quarantines_spike():
+    """
+    Test that a sudden spike is quarantined and flagged instead of being published.
+    """
+    mock_publisher = MockMqttPublisher()
+
+    adapter = Adapter(
+        gcmb_org="rivers",
+        gcmb_project="pegel-online",
+        fetch_interval=60
+    )
+    adapter.mqtt_publisher = mock_publisher
+
+    for value, timestamp in [(115.0, "2025-08-08T15:30:00+02:00"),
+                             (114.0, "2025-08-08T15:45:00+02:00"),
+                             (115.0, "2025-08-08T16:00:00+02:00"),
+                             (615.0, "2025-08-08T16:15:00+02:00"),
+                             (116.0, "2025-08-08T16:30:00+02:00")]:
+        measurements = adapter.plausibility_filter.apply([_celle_measurement(value, timestamp)])
+        adapter._publish(adapter._measurement_messages(measurements))
+
+    values = mock_publisher.get_payloads_by_topic("rivers/pegel-online/ALLER/CELLE/measurementValue")
+    assert values == ["115.0", "114.0", "115.0", "116.0"]
+
+    quality = mock_publisher.get_payloads_by_topic("rivers/pegel-online/ALLER/CELLE/quality")
+    assert quality == ["ok", "ok", "ok", "spike", "ok"]
+
+
+def test_plausibility_filter_does_not_use_spike_as_baseline():
+    """
+    Test that a spike in the first reading does not cause the following readings to be rejected.
+    """
+    plausibility_filter = PlausibilityFilter()
+
+    qualities = []
+    for value, timestamp in [(900.0, "2025-08-08T16:00:00+02:00"),
+                             (100.0, "2025-08-08T16:15:00+02:00"),
+                             (101.0, "2025-08-08T16:30:00+02:00"),
+                             (100.0, "2025-08-08T16:45:00+02:00"),
+                             (102.0, "2025-08-08T17:00:00+02:00")]:
+        measurements = plausibility_filter.apply([_celle_measurement(value, timestamp)])
+        qualities.append(measurements[0]["quality"])
+
+    assert qualities == ["ok", "ok", "ok", "ok", "ok"]
+
+    # A level that persists is accepted after the majority of the window
+    qualities = []
+    for value, timestamp in [(400.0, "2025-08-08T17:15:00+02:00"),
+                             (400.0, "2025-08-08T17:30:00+02:00"),
+                             (401.0, "2025-08-08T17:45:00+02:00")]:
+        measurements = plausibility_filter.apply([_celle_measurement(value, timestamp)])
+        qualities.append(measurements[0]["quality"])
+
+    assert qualities == ["spike", "spike", "ok"]
+
+
+def test_plausibility_history_survives_restart(tmp_path):
+    """
+    Test that the plausibility history is saved to the state directory and restored on start.
+    """
+    adapter = Adapter(
+        gcmb_org="rivers",
+        gcmb_project="pegel-online",
+        fetch_interval=60,
+        state_dir=str(tmp_path)
+    )
+    adapter.mqtt_publisher = MockMqttPublisher()
+
+    for value, timestamp in [(115.0, "2025-08-08T15:30:00+02:00"),
+                             (114.0, "2025-08-08T15:45:00+02:00"),
+                             (115.0, "2025-08-08T16:00:00+02:00")]:
+        adapter.plausibility_filter.apply([_celle_measurement(value, timestamp)])
+    adapter._save_state()
+
+    restarted = Adapter(
+        gcmb_org="rivers",
+        gcmb_project="pegel-online",
+        fetch_interval=60,
+        state_dir=str(tmp_path)
+    )
+    assert restarted.plausibility_filter.history == adapter.plausibility_filter.history
+
+    measurements = restarted.plausibility_filter.apply([_celle_measurement(615.0, "2025-08-08T16:15:00+02:00")])
+    assert measurements[0]["quality"] == "spike"
+
+
+def test_plausibility_filter_flags_stuck_and_out_of_range_values():
+    """
+    Test that stuck gauges and out-of-range values are flagged.
+    """
+    plausibility_filter = PlausibilityFilter(stuck_hours=48, gauge_bounds={("ALLER", "CELLE"): (0, 1000)})
+
+    plausibility_filter.apply([_celle_measurement(115.0, "2025-08-08T16:00:00+02:00")])
+    measurements = plausibility_filter.apply([_celle_measurement(115.0, "2025-08-09T16:00:00+02:00")])
+    assert measurements[0]["quality"] == "ok"
+
+    measurements = plausibility_filter.apply([_celle_measurement(115.0, "2025-08-10T16:00:00+02:00")])
+    assert measurements[0]["quality"] == "stuck"
+    assert measurements[0]["measurement_value"] is None
+
+    measurements = plausibility_filter.apply([_celle_measurement(-5.0, "2025-08-10T16:15:00+02:00")])
+    assert measurements[0]["quality"] == "out_of_range"
+    assert measurements[0]["measurement_value"] is None
+
+
+@patch('main.ApiClient')
+def test_plausibility_bounds(mock_api_client_class, sample_stations, sample_measurements):
+    """
+    Test that the default and per-gauge bounds from the configuration are applied in the fetch cycle.
+    """
+    mock_api_client = MagicMock()
+    mock_api_client.get_stations.return_value = sample_stations
+    mock_api_client.extract_measurement_data.return_value = sample_measurements
+    mock_api_client_class.return_value = mock_api_client
+
+    mock_publisher = MockMqttPublisher()
+
+    adapter = Adapter(
+        gcmb_org="rivers",
+        gcmb_project="pegel-online",
+        fetch_interval=60,
+        plausibility_max_value=110,
+        gauge_bounds={"ALLER/CELLE": [0, 120], "ALLER/MARKLENDORF": [0, 100]}
+    )
+    adapter.mqtt_publisher = mock_publisher
+    adapter.api_client = mock_api_client
+
+    adapter._fetch_and_publish()
+
+    # CELLE exceeds the default bound but is within its own bounds
+    assert mock_publisher.get_payloads_by_topic("rivers/pegel-online/ALLER/CELLE/quality") == ["ok"]
+    assert mock_publisher.get_payloads_by_topic("rivers/pegel-online/ALLER/CELLE/measurementValue") == ["115.0"]
+    assert mock_publisher.get_payloads_by_topic("rivers/pegel-online/ALLER/MARKLENDORF/quality") == ["out_of_range"]
+    assert mock_publisher.get_payloads_by_topic("rivers/pegel-online/ALLER/MARKLENDORF/measurementValue") == []
+
+
+@patch('main.ApiClient')
+def test_find_nearby_gauges(mock_api_client_class, sample_stations, sample_measurements):
+    """
+    Test that the spatial index is updated in the fetch cycle and used for nearby-gauge lookups.
+    """
+    mock_api_client = MagicMock()
+    mock_api_client.get_stations.return_value = sample_stations
+    mock_api_client.extract_measurement_data.return_value = sample_measurements
+    mock_api_client_class.return_value = mock_api_client
+
+    adapter = Adapter(
+        gcmb_org="rivers",
+        gcmb_project="pegel-online",
+        fetch_interval=60
+    )
+    adapter.mqtt_publisher = MockMqttPublisher()
+    adapter.api_client = mock_api_client
+
+    adapter._fetch_and_publish()
+
+    nearby = adapter.find_nearby_gauges(52.62, 10.06, 10)
+    assert [station["station_shortname"] for _, station in nearby] == ["CELLE"]
+
+    nearby = adapter.find_nearby_gauges(52.62, 10.06, 50)
+    assert [station["station_shortname"] for _, station in nearby] == ["CELLE", "MARKLENDORF"]
+
+    nearest = adapter.station_index.nearest(52.62270553213209, 10.062164093638698, 5, exclude=("ALLER", "CELLE"))
+    assert len(nearest) == 1
+    assert nearest[0][1]["station_shortname"] == "MARKLENDORF"
+    assert 20 < nearest[0][0] < 30
+
+
+def test_publish_river_profiles(sample_measurements):
+    """
+    Test that river profiles are ordered by km and travel times are estimated from level changes.
+    """
+    mock_publisher = MockMqttPublisher()
+
+    adapter = Adapter(
+        gcmb_org="rivers",
+        gcmb_project="pegel-online",
+        fetch_interval=60
+    )
+    adapter.mqtt_publisher = mock_publisher
+
+    # MARKLENDORF is listed first but is downstream of CELLE
+    celle, marklendorf = sample_measurements
+    celle["km"] = 1.74
+    marklendorf["km"] = 38.47
+
+    for celle_value, marklendorf_value, timestamp in [(115.0, 102.0, "2025-08-08T16:00:00+02:00"),
+                                                       (125.0, 102.0, "2025-08-08T16:15:00+02:00"),
+                                                       (125.0, 112.0, "2025-08-08T19:15:00+02:00")]:
+        cycle = [
+            {**marklendorf, "measurement_value": marklendorf_value, "timestamp": timestamp},
+            {**celle, "measurement_value": celle_value, "timestamp": timestamp}
+        ]
+        adapter._publish(adapter._river_profile_messages(cycle))
+
+    profiles = mock_publisher.get_payloads_by_topic("rivers/pegel-online/ALLER/profile")
+    assert len(profiles) == 3
+    assert json.loads(profiles[-1]) == [
+        {"station": "CELLE", "km": 1.74, "value": 125.0},
+        {"station": "MARKLENDORF", "km": 38.47, "value": 112.0}
+    ]
+
+    travel_times = mock_publisher.get_payloads_by_topic("rivers/pegel-online/ALLER/MARKLENDORF/travelTimeFromUpstream")
+    assert travel_times == ["180"]
+    assert mock_publisher.get_payloads_by_topic("rivers/pegel-online/ALLER/CELLE/travelTimeFromUpstream") == []
+
+    # No changes, nothing published
+    message_count = len(mock_publisher.get_all_messages())
+    adapter._publish(adapter._river_profile_messages(cycle))
+    assert len(mock_publisher.get_all_messages()) == message_count
+
+
+def test_river_profile_counted_from_mouth(tmp_path):
+    """
+    Test that stations on waters whose km is counted from the mouth are ordered upstream to downstream,
+    and that the river profile survives a restart.
+    """
+    def main_cycle(wuerzburg_value, frankfurt_value, timestamp):
+        return [
+            {"water_shortname": "MAIN", "station_shortname": "FRANKFURT OSTHAFEN", "km": 36.6,
+             "measurement_value": frankfurt_value, "timestamp": timestamp},
+            {"water_shortname": "MAIN", "station_shortname": "WÜRZBURG", "km": 252.1,
+             "measurement_value": wuerzburg_value, "timestamp": timestamp}
+        ]
+
+    adapter = Adapter(
+        gcmb_org="rivers",
+        gcmb_project="pegel-online",
+        fetch_interval=60,
+        state_dir=str(tmp_path)
+    )
+    adapter.mqtt_publisher = MockMqttPublisher()
+
+    adapter._publish(adapter._river_profile_messages(main_cycle(150.0, 180.0, "2025-08-08T06:00:00+02:00")))
+    adapter._publish(adapter._river_profile_messages(main_cycle(170.0, 180.0, "2025-08-08T06:15:00+02:00")))
+    adapter._save_state()
+
+    # WÜRZBURG has the higher km but is upstream of FRANKFURT OSTHAFEN
+    restarted = Adapter(
+        gcmb_org="rivers",
+        gcmb_project="pegel-online",
+        fetch_interval=60,
+        state_dir=str(tmp_path)
+    )
+    mock_publisher = MockMqttPublisher()
+    restarted.mqtt_publisher = mock_publisher
+    restarted._publish(restarted._river_profile_messages(main_cycle(170.0, 200.0, "2025-08-08T18:15:00+02:00")))
+
+    profiles = mock_publisher.get_payloads_by_topic("rivers/pegel-online/MAIN/profile")
+    assert json.loads(profiles[-1]) == [
+        {"station": "WÜRZBURG", "km": 252.1, "value": 170.0},
+        {"station": "FRANKFURT OSTHAFEN", "km": 36.6, "value": 200.0}
+    ]
+
+    travel_times = mock_publisher.get_payloads_by_topic(
+        "rivers/pegel-online/MAIN/FRANKFURT-OSTHAFEN/travelTimeFromUpstream")
+    assert travel_times == ["720"]
+
+    # Without MAIN in the configured waters, its km is taken as increasing downstream
+    configured = Adapter(
+        gcmb_org="rivers",
+        gcmb_project="pegel-online",
+        fetch_interval=60,
+        river_km_descending={"DONAU"}
+    )
+    mock_publisher = MockMqttPublisher()
+    configured.mqtt_publisher = mock_publisher
+    configured._publish(configured._river_profile_messages(main_cycle(170.0, 200.0, "2025-08-08T18:15:00+02:00")))
+
+    profile = json.loads(mock_publisher.get_payloads_by_topic("rivers/pegel-online/MAIN/profile")[-1])
+    assert [station["station"] for station in profile] == ["FRANKFURT OSTHAFEN", "WÜRZBURG"]
+
+
+@patch('main.ApiClient')
+def test_trace_file_per_cycle(mock_api_client_class, sample_stations, sample_measurements, tmp_path):
+    """
+    Test that a trace file with the cycle stages is written when tracing is enabled.
+    """
+    mock_api_client = MagicMock()
+    mock_api_client.get_stations.return_value = sample_stations
+    mock_api_client.extract_measurement_data.return_value = sample_measurements
+    mock_api_client_class.return_value = mock_api_client
+
+    adapter = Adapter(
+        gcmb_org="rivers",
+        gcmb_project="pegel-online",
+        fetch_interval=60,
+        trace_dir=str(tmp_path)
+    )
+    adapter.mqtt_publisher = MockMqttPublisher()
+    adapter.api_client = mock_api_client
+
+    adapter.tracer.start_cycle()
+    adapter._fetch_and_publish()
+    adapter.tracer.end_cycle()
+
+    trace_files = list(tmp_path.glob("trace-*.json"))
+    assert len(trace_files) == 1
+
+    trace = json.loads(trace_files[0].read_text())
+    span_names = [span[0] for span in trace["spans"]]
+    assert span_names == ["fetch", "extract", "station_index", "plausibility",
+                          "river_profile", "publish"]
+    assert trace["spans"][1][3] == {"measurements": 2}
+    assert trace["spans"][5][3]["targets"]["default"]["queued"] == 8
+
+
+def test_sampling_profiler(tmp_path):
+    """
+    Test that the sampling profiler requested by SIGUSR1 writes the collapsed stacks of a busy loop.
+    """
+    adapter = Adapter(
+        gcmb_org="rivers",
+        gcmb_project="pegel-online",
+        fetch_interval=60
+    )
+    adapter._request_profile(signal.SIGUSR1, None)
+    assert adapter.profile_next_cycle
+
+    def busy_loop():
+        deadline = time.perf_counter() + 0.2
+        while time.perf_counter() < deadline:
+            sum(range(1000))
+
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start()
+    busy_loop()
+    path = profiler.stop(str(tmp_path))
+
+    stacks = path.read_text().splitlines()
+    assert stacks
+    assert any("busy_loop" in stack for stack in stacks)
+
+    # A profile that cannot be written is logged instead of raising
+    profiler.start()
+    assert profiler.stop(str(tmp_path / "missing")) is None
+
+
+def test_typed_decoder_matches_generic_decoder(sample_stations):
+    """
+    Test that the typed decoder yields the same measurements as the generic decoder.
+    """
+    body = json.dumps(sample_stations).encode()
+    generic_client = ApiClient(decoder="generic")
+    typed_client = ApiClient(decoder="typed")
+
+    generic_measurements = generic_client.extract_measurement_data(generic_client.decode_stations(body))
+    typed_measurements = typed_client.extract_measurement_data(typed_client.decode_stations(body))
+
+    assert typed_measurements == generic_measurements
+    assert typed_measurements[0]["km"] == 1.74
+    assert typed_measurements[1]["measurement_value"] == 102.0
+
+    # A response not matching the schema is decoded by the generic decoder
+    stations = typed_client.decode_stations(b'[{"shortname": 1}]')
+    assert stations == [{"shortname": 1}]
+
+
+def test_decoders_extract_stations_with_unexpected_field_types(sample_stations):
+    """
+    Test that measurements are still extracted if a field that is passed through has an unexpected type.
+    """
+    for station in sample_stations:
+        station["km"] = str(station["km"])
+    body = json.dumps(sample_stations).encode()
+
+    for decoder in ("generic", "typed"):
+        api_client = ApiClient(decoder=decoder)
+        measurements = api_client.extract_measurement_data(api_client.decode_stations(body))
+
+        assert len(measurements) == 2
+        assert measurements[0]["km"] == "1.74"
+        assert measurements[1]["measurement_value"] == 102.0
+
+    # The stations are published, but not placed on the river profile
+    mock_publisher = MockMqttPublisher()
+    adapter = Adapter(gcmb_org="rivers", gcmb_project="pegel-online", fetch_interval=60)
+    adapter.mqtt_publisher = mock_publisher
+    adapter.api_client.get_stations = MagicMock(return_value=sample_stations)
+    adapter._fetch_and_publish()
+
+    topics = mock_publisher.get_all_topics()
+    assert "rivers/pegel-online/ALLER/CELLE/measurementValue" in topics
+    assert "rivers/pegel-online/ALLER/profile" not in topics
+
+
+class StalledMqttPublisher(MockMqttPublisher):
+    """
+    Publisher whose broker is unreachable, so its messages stay queued.
+    """
+    def __init__(self, maxsize):
+        super().__init__()
+        self.msg_queue = queue.Queue(maxsize=maxsize)
+        self.start_time -= 3600
+
+    def send_msg(self, payload, topic, retain=False):
+        self.msg_queue.put((payload, topic, retain))
+
+
+def test_publish_to_multiple_targets(sample_measurements):
+    """
+    Test that measurements are published to all targets with their own topic prefix and filters,
+    and that a stalled target drops messages and is reported as unhealthy without affecting the others.
+    """
+    adapter = Adapter(
+        gcmb_org="rivers",
+        gcmb_project="pegel-online",
+        fetch_interval=60,
+        publish_targets=[
+            {"name": "aller", "org": "other-org", "project": "aller", "waters": ["ALLER"]},
+            {"name": "rhine", "org": "other-org", "project": "rhine", "waters": ["RHEIN"]},
+            {"name": "stalled", "org": "stalled-org", "project": "pegel-online"}
+        ]
+    )
+    default_publisher = MockMqttPublisher()
+    aller_publisher = MockMqttPublisher()
+    rhine_publisher = MockMqttPublisher()
+    stalled_publisher = StalledMqttPublisher(maxsize=4)
+    adapter.mqtt_publisher = default_publisher
+    adapter.targets[1].publisher = aller_publisher
+    adapter.targets[2].publisher = rhine_publisher
+    adapter.targets[3].publisher = stalled_publisher
+
+    adapter._publish(adapter._measurement_messages(sample_measurements))
+
+    assert len(default_publisher.get_payloads_by_topic("rivers/pegel-online/ALLER/CELLE/measurementValue")) == 1
+    assert len(default_publisher.get_all_messages()) == 7
+    assert aller_publisher.get_payloads_by_topic("other-org/aller/ALLER/CELLE/measurementValue") == ["115.0"]
+    assert len(aller_publisher.get_all_messages()) == 6
+    assert rhine_publisher.get_all_messages() == []
+    assert stalled_publisher.msg_queue.get_nowait() == ("115.0", "stalled-org/pegel-online/ALLER/CELLE/measurementValue", True)
+
+    first_cycle = adapter.targets[3].pending_since
+
+    # Messages for the full queue are dropped instead of blocking the cycle
+    adapter._publish(adapter._measurement_messages(sample_measurements))
+    assert len(default_publisher.get_all_messages()) == 14
+
+    # The latency of the stalled target is the age of its first cycle, which is still queued
+    stats = adapter.targets[3].stats()
+    assert stats["queued"] == 5
+    assert stats["dropped"] == 7
+    assert stats["queue_size"] == 4
+    assert stats["seconds_since_success"] is None
+    assert stats["latency_seconds"] is not None
+    assert stats["unhealthy_cycles"] == 2
+    assert adapter.targets[3].pending_since == first_cycle
+
+    stats = adapter.targets[0].stats()
+    assert stats["queued"] == 12
+    assert stats["dropped"] == 0
+    assert stats["seconds_since_success"] is not None
+    assert stats["latency_seconds"] < 1
+    assert stats["unhealthy_cycles"] == 0
+
+    # Nothing was queued for the rhine target
+    assert adapter.targets[2].stats()["latency_seconds"] is None
+
+    # The stats of all targets are published on the default target
+    published_stats = json.loads(default_publisher.get_payloads_by_topic("rivers/pegel-online/publishTargets")[-1])
+    assert list(published_stats) == ["default", "aller", "rhine", "stalled"]
+    assert published_stats["stalled"]["dropped"] == 7
+
+
+@patch('gcmb_publisher.Thread', create=True)
+@patch('publish_targets.mqtt.Client')
+@patch('main.MqttPublisher')
+def test_publish_target_with_own_broker(mock_mqtt_publisher_class, mock_client_class, mock_thread, monkeypatch):
+    """
+    Test that a target with its own broker connects in the background and that a misconfigured target is skipped.
+    """
+    mock_mqtt_publisher_class.return_value = MockMqttPublisher()
+    monkeypatch.setenv("MIRROR_MQTT_PASSWORD", "secret")
+    monkeypatch.delenv("MISSING_MQTT_PASSWORD", raising=False)
+
+    adapter = Adapter(
+        gcmb_org="rivers",
+        gcmb_project="pegel-online",
+        fetch_interval=60,
+        publish_targets=[
+            {"name": "mirror", "org": "rivers", "project": "pegel-online", "mqtt_host": "broker.example.com",
+             "mqtt_username": "rivers/pegel-online/mirror", "mqtt_password_env": "MIRROR_MQTT_PASSWORD"},
+            {"name": "missing", "org": "rivers", "project": "pegel-online", "mqtt_host": "broker.example.com",
+             "mqtt_username": "rivers/pegel-online/missing", "mqtt_password_env": "MISSING_MQTT_PASSWORD"}
+        ]
+    )
+
+    assert [target.name for target in adapter.targets] == ["default", "mirror"]
+
+    # The connection is established by the client thread, which retries if the broker is unreachable
+    mock_client = mock_client_class.return_value
+    mock_client_class.assert_called_once_with(client_id="rivers/pegel-online/mirror/pub",
+                                              callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+    mock_client.username_pw_set.assert_called_once_with("rivers/pegel-online/mirror", "secret")
+    mock_client.connect_async.assert_called_once_with("broker.example.com", 8883)
+    mock_client.connect.assert_not_called()
+    assert adapter.targets[1].publisher.mqtt_client is mock_client
@@ -0,0 +1,175 @@
+import json
+import logging
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Tracer:
+    """
+    Minimal tracer for the fetch and publish cycle.
+    Records spans per cycle and writes them as one compact JSON file per cycle.
+    Without a trace directory, spans are not recorded and cost a single attribute check.
+    """
+
+    def __init__(self, trace_dir: Optional[str] = None, keep: int = 96):
+        """
+        Initialize the tracer.
+
+        Args:
+            trace_dir: Directory for the trace files, tracing is disabled if empty
+            keep: Number of trace files to keep, older ones are deleted
+        """
+        self.trace_dir = Path(trace_dir) if trace_dir else None
+        self.keep = keep
+        self.enabled = self.trace_dir is not None
+        self.cycle_start = None
+        self.cycle_started_at = None
+        self.spans: List[List[Any]] = []
+
+        if self.enabled:
+            self.trace_dir.mkdir(parents=True, exist_ok=True)
+            logger.info(f"Writing traces to {self.trace_dir}")
+
+    def start_cycle(self):
+        """
+        Start recording a new cycle.
+        """
+        if not self.enabled:
+            return
+        self.cycle_start = time.perf_counter()
+        self.cycle_started_at = datetime.now(timezone.utc)
+        self.spans = []
+
+    def end_cycle(self):
+        """
+        Finish the current cycle and write its trace file.
+        """
+        if not self.enabled or self.cycle_start is None:
+            return
+
+        trace = {
+            "start": self.cycle_started_at.isoformat(),
+            "duration_ms": round((time.perf_counter() - self.cycle_start) * 1000, 3),
+            # [name, start offset in ms, duration in ms, attributes]
+            "spans": self.spans
+        }
+        self.cycle_start = None
+
+        path = self.trace_dir / f"trace-{self.cycle_started_at.strftime('%Y%m%dT%H%M%S')}.json"
+        try:
+            with open(path, "w") as f:
+                json.dump(trace, f, separators=(",", ":"))
+            self._prune()
+        except OSError as e:
+            logger.error(f"Error writing trace file {path}: {e}")
+            return
+
+        logger.debug("Wrote trace file %s", path)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Record a span around a block of code.
+
+        Args:
+            name: Name of the span
+            attributes: Attributes stored with the span; the yielded dict can be used to add more
+        """
+        if not self.enabled or self.cycle_start is None:
+            yield attributes
+            return
+
+        start = time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            end = time.perf_counter()
+            self.spans.append([
+                name,
+                round((start - self.cycle_start) * 1000, 3),
+                round((end - start) * 1000, 3),
+                attributes
+            ])
+
+    def _prune(self):
+        traces = sorted(self.trace_dir.glob("trace-*.json"))
+        for path in traces[:-self.keep]:
+            path.unlink(missing_ok=True)
+
+
+class SamplingProfiler:
+    """
+    Sampling profiler for a single thread.
+    A background thread periodically captures the stack of the profiled thread and
+    counts identical stacks. The result is written in collapsed stack format, which
+    can be rendered with common flame graph tools.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        """
+        Initialize the sampling profiler.
+
+        Args:
+            interval: Sampling interval in seconds
+        """
+        self.interval = interval
+        self.samples = Counter()
+        self.thread_id = None
+        self.stop_event = threading.Event()
+        self.sampler = None
+
+    def start(self):
+        """
+        Start sampling the calling thread.
+        """
+        self.thread_id = threading.get_ident()
+        self.samples.clear()
+        self.stop_event.clear()
+        self.sampler = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self.sampler.start()
+
+    def stop(self, output_dir: Optional[str] = None) -> Optional[Path]:
+        """
+        Stop sampling and write the collapsed stacks.
+
+        Args:
+            output_dir: Directory for the profile file, defaults to the temp directory
+
+        Returns:
+            Path of the written profile file, or None if it could not be written
+        """
+        self.stop_event.set()
+        self.sampler.join()
+
+        directory = Path(output_dir) if output_dir else Path(tempfile.gettempdir())
+        path = directory / f"profile-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}.folded"
+        try:
+            with open(path, "w") as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+        except OSError as e:
+            logger.error(f"Error writing profile file {path}: {e}")
+            return None
+
+        logger.info(f"Wrote profile with {sum(self.samples.values())} samples to {path}")
+        return path
+
+    def _sample(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
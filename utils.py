@@ -1,3 +1,13 @@
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
 def sanitize_topic(topic_name: str):
     return (topic_name
             .replace(' ', '-')
@@ -10,4 +20,73 @@ def sanitize_topic(topic_name: str):
             .replace('ö', 'oe')
             .replace('ü', 'ue')
             .replace('ß', 'ss')
-            )
\ No newline at end of file
+            )
+
+
+def parse_timestamp(timestamp: Optional[str]) -> Optional[datetime]:
+    """
+    Parse an ISO 8601 timestamp as delivered by the API.
+
+    Args:
+        timestamp: Timestamp string, e.g. "2025-08-08T16:15:00+02:00"
+
+    Returns:
+        Parsed timestamp or None if missing or invalid
+    """
+    if not timestamp:
+        return None
+    try:
+        return datetime.fromisoformat(timestamp)
+    except ValueError:
+        return None
+
+
+def format_timestamp(timestamp: Optional[datetime]) -> Optional[str]:
+    """
+    Format a timestamp as ISO 8601, the inverse of parse_timestamp.
+
+    Args:
+        timestamp: Timestamp or None
+
+    Returns:
+        Timestamp string or None
+    """
+    return timestamp.isoformat() if timestamp is not None else None
+
+
+def load_state(path: Path) -> Optional[Any]:
+    """
+    Load state that was saved with save_state.
+
+    Args:
+        path: Path of the state file
+
+    Returns:
+        Loaded state or None if the file is missing or unreadable
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.error(f"Error loading state file {path}: {e}")
+        return None
+
+
+def save_state(path: Path, state: Any):
+    """
+    Save state as JSON. The file is replaced atomically, so a restart during
+    writing leaves the previous state intact.
+
+    Args:
+        path: Path of the state file
+        state: JSON-serializable state
+    """
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.error(f"Error saving state file {path}: {e}")
@@ -1,8 +1,17 @@
+import queue
+import time
+
+
 class MockMqttPublisher:
     def __init__(self):
         self.messages = []  # List of (payload, topic, retain)
+        # Same attributes as MqttPublisher, messages are sent immediately
+        self.msg_queue = queue.Queue()
+        self.start_time = time.time()
+        self.last_successful_message = None
     def send_msg(self, payload, topic, retain=False):
         self.messages.append({'payload': payload, 'topic': topic, 'retain': retain})
+        self.last_successful_message = time.time()
     def get_messages_by_topic(self, topic):
         return [m for m in self.messages if m['topic'] == topic]
     def get_payloads_by_topic(self, topic):